@@ -1,40 +1,76 @@
-import os
+import asyncio
 import logging
+import os
 import secrets
-from dotenv import load_dotenv
 
-from fastapi import FastAPI, Request, Depends, HTTPException, status
-from fastapi.responses import HTMLResponse
+import orjson
+from dotenv import load_dotenv
+from fastapi import Depends, FastAPI, HTTPException, Request, status
+from fastapi.middleware.gzip import GZipMiddleware
+from fastapi.responses import HTMLResponse, Response
 from fastapi.security import HTTPBasic, HTTPBasicCredentials
 
-# Conditional imports to handle environments lacking certain modules
-def safe_import(module_name, alias=None):
-    try:
-        module = __import__(module_name)
-        if alias:
-            globals()[alias] = module
-        else:
-            globals()[module_name] = module
-    except ImportError:
-        print(f"Warning: Could not import {module_name}. Some functionality may be limited.")
-
-safe_import("provision.entra", "entra")
-safe_import("provision.aws", "aws")
-safe_import("provision.sailpoint", "sailpoint")
-safe_import("logic.ai_recommender", "ai_recommender")
-safe_import("logic.opa_enforcer", "opa_enforcer")
+from config.settings import OPENAI_KEY
+from logic import ai_recommender, opa_enforcer
+from logic.audit_log import (
+    audit_log_etag,
+    configure_audit_logging,
+    read_log_tail,
+    render_dashboard_html,
+    search_log,
+    start_audit_log_writer,
+    stop_audit_log_writer,
+)
+from logic.utils import (
+    ORJSONResponse,
+    bind_request_cache,
+    call_provider,
+    close_http_client,
+    get_http_client,
+    reset_request_cache,
+    run_async,
+    unwrap_result,
+    warm_up_providers,
+)
+from provision import aws, entra, sailpoint
 
 # Load environment variables from .env file
 load_dotenv()
 
-app = FastAPI()
+app = FastAPI(default_response_class=ORJSONResponse)
 security = HTTPBasic()
 
+app.add_middleware(GZipMiddleware, minimum_size=1024)
+
 DASHBOARD_USER = os.getenv("DASHBOARD_USER", "admin")
 DASHBOARD_PASS = os.getenv("DASHBOARD_PASS", "adminpass")
+DASHBOARD_CACHE_HEADERS = {"Cache-Control": "private, max-age=5"}
 
 os.makedirs("logs", exist_ok=True)
-logging.basicConfig(filename="logs/audit.log", level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+configure_audit_logging()
+
+@app.on_event("startup")
+async def startup():
+    start_audit_log_writer()
+    get_http_client()
+    if OPENAI_KEY:
+        ai_recommender.get_openai_client()
+    await warm_up_providers()
+
+@app.on_event("shutdown")
+async def shutdown():
+    await close_http_client()
+    await ai_recommender.close_openai_client()
+    stop_audit_log_writer()
+
+@app.middleware("http")
+async def request_cache_middleware(request: Request, call_next):
+    request.state.cache = {}
+    token = bind_request_cache(request.state.cache)
+    try:
+        return await call_next(request)
+    finally:
+        reset_request_cache(token)
 
 def authenticate(credentials: HTTPBasicCredentials = Depends(security)):
     correct_username = secrets.compare_digest(credentials.username, DASHBOARD_USER)
@@ -51,45 +87,51 @@ def health_check():
     return {"status": "ok"}
 
 @app.get("/dashboard", response_class=HTMLResponse)
-def dashboard(credentials: HTTPBasicCredentials = Depends(authenticate)):
+def dashboard(request: Request, q: str | None = None, credentials: HTTPBasicCredentials = Depends(authenticate)):
     try:
-        with open("logs/audit.log", "r") as f:
-            logs = f.readlines()
-        logs.reverse()
-        formatted_logs = ''.join(f"<div>{log.strip()}</div>" for log in logs)
-        return f"""
-            <html>
-                <head><title>Audit Log Dashboard</title></head>
-                <body>
-                    <h2>Audit Log</h2>
-                    <form method='get'>
-                        <input type='text' name='q' placeholder='Search logs...' />
-                        <input type='submit' value='Search' />
-                    </form>
-                    <div style='font-family: monospace; white-space: pre-wrap;'>{formatted_logs}</div>
-                </body>
-            </html>
-        """
+        etag = audit_log_etag()
+        if request.headers.get("if-none-match") == etag:
+            return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers={"ETag": etag, **DASHBOARD_CACHE_HEADERS})
+        logs = search_log(q) if q else read_log_tail()
     except FileNotFoundError:
         return "<html><body><h2>No logs available yet.</h2></body></html>"
+    return HTMLResponse(render_dashboard_html(logs, q), headers={"ETag": etag, **DASHBOARD_CACHE_HEADERS})
 
 @app.post("/provision/user")
 async def provision_user(request: Request):
-    user = await request.json()
+    user = orjson.loads(await request.body())
     logging.info(f"Received provisioning request for: {user.get('email', 'unknown')}")
 
-    ai_access = ai_recommender.get_access_recommendation(user) if ai_recommender else {}
-    logging.info(f"AI access recommendation: {ai_access}")
+    # The AI recommendation and the policy check are independent, so start both up front
+    ai_task = asyncio.create_task(run_async(ai_recommender.get_access_recommendation, user))
+    policy_task = asyncio.create_task(run_async(opa_enforcer.enforce_policy, user))
 
-    policy_check = opa_enforcer.enforce_policy(user) if opa_enforcer else {"allow": True}
+    try:
+        policy_check = await policy_task
+    except Exception as e:
+        logging.error(f"OPA policy enforcement failed: {e}")
+        policy_check = {"allow": False, "reason": "OPA policy check failed"}
     if not policy_check.get("allow", False):
+        ai_task.cancel()
         reason = policy_check.get("reason", "Policy Violation")
         logging.warning(f"Access denied due to policy: {reason}")
         return {"status": "denied", "reason": reason}
 
-    entra_status, entra_result = entra.create_entra_user(user) if entra else ("error", "module missing")
-    aws_status = aws.create_user(user) if aws else "module missing"
-    sailpoint_result = sailpoint.push_to_sailpoint(user) if sailpoint else "module missing"
+    ai_access, entra_outcome, aws_status, sailpoint_result = await asyncio.gather(
+        ai_task,
+        call_provider(entra, "create_entra_user", user),
+        call_provider(aws, "create_user", user),
+        call_provider(sailpoint, "push_to_sailpoint", user),
+        return_exceptions=True,
+    )
+    ai_access = unwrap_result(ai_access, "AI recommender")
+    logging.info(f"AI access recommendation: {ai_access}")
+    if isinstance(entra_outcome, tuple):
+        entra_status, entra_result = entra_outcome
+    else:
+        entra_status, entra_result = "error", unwrap_result(entra_outcome, "Entra")
+    aws_status = unwrap_result(aws_status, "AWS")
+    sailpoint_result = unwrap_result(sailpoint_result, "SailPoint")
 
     logging.info(f"Provisioning complete: Entra={entra_status}, AWS={aws_status}, SailPoint={sailpoint_result}")
 
@@ -104,18 +146,30 @@ async def provision_user(request: Request):
 
 @app.post("/deprovision/user")
 async def deprovision_user(request: Request):
-    user = await request.json()
-    entra_status = entra.delete_entra_user(user) if entra else "module missing"
-    aws_status = aws.delete_user(user) if aws else "module missing"
-    sailpoint_status = sailpoint.delete_user(user) if sailpoint else "module missing"
+    user = orjson.loads(await request.body())
+    results = await asyncio.gather(
+        call_provider(entra, "delete_entra_user", user),
+        call_provider(aws, "delete_user", user),
+        call_provider(sailpoint, "delete_user", user),
+        return_exceptions=True,
+    )
+    entra_status, aws_status, sailpoint_status = (
+        unwrap_result(result, name) for result, name in zip(results, ("Entra", "AWS", "SailPoint"), strict=True)
+    )
     logging.info(f"Deprovisioned user: {user.get('email', 'unknown')}, Entra={entra_status}, AWS={aws_status}, SailPoint={sailpoint_status}")
     return {"entra_status": entra_status, "aws_status": aws_status, "sailpoint_status": sailpoint_status}
 
 @app.post("/update/user")
 async def update_user(request: Request):
-    user = await request.json()
-    entra_status = entra.update_entra_user(user) if entra else "module missing"
-    aws_status = aws.update_user(user) if aws else "module missing"
-    sailpoint_status = sailpoint.update_user_attributes(user) if sailpoint else "module missing"
+    user = orjson.loads(await request.body())
+    results = await asyncio.gather(
+        call_provider(entra, "update_entra_user", user),
+        call_provider(aws, "update_user", user),
+        call_provider(sailpoint, "update_user_attributes", user),
+        return_exceptions=True,
+    )
+    entra_status, aws_status, sailpoint_status = (
+        unwrap_result(result, name) for result, name in zip(results, ("Entra", "AWS", "SailPoint"), strict=True)
+    )
     logging.info(f"Updated user: {user.get('email', 'unknown')}, Entra={entra_status}, AWS={aws_status}, SailPoint={sailpoint_status}")
     return {"entra_status": entra_status, "aws_status": aws_status, "sailpoint_status": sailpoint_status}
@@ -9,4 +9,24 @@ SAILPOINT_API_KEY = os.getenv("SAILPOINT_API_KEY")
 OPA_URL = os.getenv("OPA_URL", "http://localhost:8181/v1/data/access/policy")
 
 OPENAI_KEY = os.getenv("OPENAI_API_KEY")
+OPENAI_MODEL = os.getenv("OPENAI_MODEL", "gpt-4o-mini")
 
+HTTP_TIMEOUT = float(os.getenv("HTTP_TIMEOUT", "10"))
+HTTP_MAX_CONNECTIONS = int(os.getenv("HTTP_MAX_CONNECTIONS", "100"))
+HTTP_MAX_KEEPALIVE = int(os.getenv("HTTP_MAX_KEEPALIVE", "20"))
+
+RECOMMENDATION_CACHE_SIZE = int(os.getenv("RECOMMENDATION_CACHE_SIZE", "10000"))
+RECOMMENDATION_CACHE_TTL = int(os.getenv("RECOMMENDATION_CACHE_TTL", "3600"))
+
+# Upper bounds on in-flight calls per downstream provider, kept within the HTTP pool size
+OPENAI_MAX_CONCURRENCY = int(os.getenv("OPENAI_MAX_CONCURRENCY", "20"))
+GRAPH_MAX_CONCURRENCY = int(os.getenv("GRAPH_MAX_CONCURRENCY", "50"))
+AWS_MAX_CONCURRENCY = int(os.getenv("AWS_MAX_CONCURRENCY", "30"))
+SAILPOINT_MAX_CONCURRENCY = int(os.getenv("SAILPOINT_MAX_CONCURRENCY", "20"))
+HTTP_RETRY_ATTEMPTS = int(os.getenv("HTTP_RETRY_ATTEMPTS", "3"))
+
+STARTUP_WARMUP_TIMEOUT = float(os.getenv("STARTUP_WARMUP_TIMEOUT", "5"))
+
+# Coalesce bursts of audit records into a single write() (set AUDIT_LOG_BATCH_WRITES=1 to enable)
+AUDIT_LOG_BATCH_WRITES = os.getenv("AUDIT_LOG_BATCH_WRITES") == "1"
+AUDIT_LOG_BATCH_BYTES = int(os.getenv("AUDIT_LOG_BATCH_BYTES", str(64 * 1024)))
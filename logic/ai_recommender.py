@@ -1,26 +1,67 @@
+import asyncio
 import logging
 
-import openai
+from cachetools import TTLCache
+from openai import AsyncOpenAI
 
-from config.settings import OPENAI_KEY
+from config.settings import (
+    OPENAI_KEY,
+    OPENAI_MAX_CONCURRENCY,
+    OPENAI_MODEL,
+    RECOMMENDATION_CACHE_SIZE,
+    RECOMMENDATION_CACHE_TTL,
+)
+from logic.utils import profile_cache_key, request_cached
 
-openai.api_key = OPENAI_KEY
+_openai_client = None
+# The OpenAI SDK already retries 429/5xx with backoff; this only caps how many calls are in flight
+OPENAI_SEM = asyncio.Semaphore(OPENAI_MAX_CONCURRENCY)
+
+# Prompts only depend on a handful of role attributes, so most users share a recommendation
+_recommendation_cache = TTLCache(maxsize=RECOMMENDATION_CACHE_SIZE, ttl=RECOMMENDATION_CACHE_TTL)
+
+def get_openai_client():
+    global _openai_client
+    if _openai_client is None:
+        _openai_client = AsyncOpenAI(api_key=OPENAI_KEY)
+    return _openai_client
+
+async def close_openai_client():
+    global _openai_client
+    if _openai_client is not None:
+        await _openai_client.close()
+        _openai_client = None
+
+@request_cached
+async def get_access_recommendation(user_profile):
+    profile = {
+        'title': user_profile.get('title', ''),
+        'department': user_profile.get('department', ''),
+        'level': user_profile.get('level', ''),
+        'region': user_profile.get('location', ''),
+    }
+    key = profile_cache_key(profile)
+    cached = _recommendation_cache.get(key)
+    if cached is not None:
+        return cached
 
-def get_access_recommendation(user_profile):
     prompt = f"""
     Recommend roles and access for:
-    Job Title: {user_profile.get('title', '')}
-    Department: {user_profile.get('department', '')}
-    Level: {user_profile.get('level', '')}
-    Region: {user_profile.get('location', '')}
+    Job Title: {profile['title']}
+    Department: {profile['department']}
+    Level: {profile['level']}
+    Region: {profile['region']}
     """
     try:
-        response = openai.ChatCompletion.create(
-            model="gpt-4",
-            messages=[{"role": "user", "content": prompt}]
-        )
-        return response['choices'][0]['message']['content']
+        async with OPENAI_SEM:
+            response = await get_openai_client().chat.completions.create(
+                model=OPENAI_MODEL,
+                messages=[{"role": "user", "content": prompt}]
+            )
+        result = response.choices[0].message.content
     except Exception as e:
         logging.error(f"LLM error: {str(e)}")
         return f"Error during LLM access recommendation: {str(e)}"
 
+    _recommendation_cache[key] = result
+    return result
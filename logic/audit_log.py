@@ -0,0 +1,154 @@
+import logging
+import os
+import queue
+import re
+import sys
+import traceback
+from collections import deque
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
+
+from jinja2 import Environment, FileSystemLoader
+
+from config.settings import AUDIT_LOG_BATCH_BYTES, AUDIT_LOG_BATCH_WRITES
+
+AUDIT_LOG_PATH = "logs/audit.log"
+TAIL_BYTES = 64 * 1024
+TAIL_LINES = 500
+SEARCH_BLOCK_SIZE = 1024 * 1024
+AUDIT_LOG_MAX_BYTES = 50_000_000
+AUDIT_LOG_BACKUPS = 5
+AUDIT_LOG_FORMAT = '%(asctime)s - %(levelname)s - %(message)s'
+
+# Handlers only enqueue records; a listener thread does the file writes off the event loop
+_log_queue = queue.Queue(-1)
+_queue_handler = QueueHandler(_log_queue)
+_listener = None
+
+# Compiled once at import; autoescape keeps log content from being interpreted as HTML
+_templates = Environment(loader=FileSystemLoader("templates"), autoescape=True, auto_reload=False)
+dashboard_template = _templates.get_template("dashboard.html")
+
+
+class BatchedRotatingFileHandler(RotatingFileHandler):
+    # Buffers records while more are waiting in the queue, then writes the whole burst with one write()
+    def __init__(self, filename, pending, max_batch_bytes=AUDIT_LOG_BATCH_BYTES, **kwargs):
+        super().__init__(filename, **kwargs)
+        self.pending = pending
+        self.max_batch_bytes = max_batch_bytes
+        self._batch = []
+        self._batch_bytes = 0
+
+    def emit(self, record):
+        try:
+            line = self.format(record) + self.terminator
+        except Exception:
+            self.handleError(record)
+            return
+        self._batch.append(line)
+        self._batch_bytes += len(line)
+        if self._batch_bytes >= self.max_batch_bytes or self.pending.empty():
+            self.flush_batch()
+
+    def flush_batch(self):
+        if not self._batch:
+            return
+        data = "".join(self._batch)
+        self._batch.clear()
+        self._batch_bytes = 0
+        try:
+            if self.stream is None:
+                self.stream = self._open()
+            if self.maxBytes > 0 and self.stream.tell() + len(data) >= self.maxBytes:
+                self.doRollover()
+            self.stream.write(data)
+            self.stream.flush()
+        except Exception:
+            # Same policy as Handler.handleError: report to stderr, never kill the listener thread
+            if logging.raiseExceptions:
+                traceback.print_exc(file=sys.stderr)
+
+    def close(self):
+        self.acquire()
+        try:
+            self.flush_batch()
+        finally:
+            self.release()
+        super().close()
+
+
+def configure_audit_logging():
+    root = logging.getLogger()
+    root.setLevel(logging.INFO)
+    if _queue_handler not in root.handlers:
+        root.addHandler(_queue_handler)
+    # httpx logs every outbound request at INFO, which would bury the audit trail
+    logging.getLogger("httpx").setLevel(logging.WARNING)
+
+
+def start_audit_log_writer(path=AUDIT_LOG_PATH):
+    global _listener
+    if _listener is not None:
+        return
+    if AUDIT_LOG_BATCH_WRITES:
+        file_handler = BatchedRotatingFileHandler(
+            path, _log_queue, maxBytes=AUDIT_LOG_MAX_BYTES, backupCount=AUDIT_LOG_BACKUPS
+        )
+    else:
+        file_handler = RotatingFileHandler(path, maxBytes=AUDIT_LOG_MAX_BYTES, backupCount=AUDIT_LOG_BACKUPS)
+    file_handler.setFormatter(logging.Formatter(AUDIT_LOG_FORMAT))
+    _listener = QueueListener(_log_queue, file_handler, respect_handler_level=True)
+    _listener.start()
+
+
+def stop_audit_log_writer():
+    global _listener
+    if _listener is None:
+        return
+    # stop() drains whatever is still queued before the listener thread exits
+    _listener.stop()
+    for handler in _listener.handlers:
+        handler.close()
+    _listener = None
+
+
+def audit_log_etag(path=AUDIT_LOG_PATH):
+    stat = os.stat(path)
+    return f'"{stat.st_mtime_ns:x}-{stat.st_size:x}"'
+
+
+def read_log_tail(path=AUDIT_LOG_PATH, max_bytes=TAIL_BYTES, max_lines=TAIL_LINES):
+    # Only the end of the log is shown, so never read more than the last max_bytes
+    with open(path, "rb") as f:
+        f.seek(0, os.SEEK_END)
+        size = f.tell()
+        f.seek(max(0, size - max_bytes))
+        chunk = f.read()
+    lines = chunk.decode(errors="ignore").splitlines()
+    if size > max_bytes:
+        # The first line is most likely cut in half by the seek
+        lines = lines[1:]
+    lines = lines[-max_lines:]
+    lines.reverse()
+    return lines
+
+
+def search_log(query, path=AUDIT_LOG_PATH, max_lines=TAIL_LINES):
+    # One compiled pattern scans whole blocks in C rather than testing each line in Python
+    pattern = re.compile(rf"^.*{re.escape(query)}.*$", re.IGNORECASE | re.MULTILINE)
+    matches = deque(maxlen=max_lines)
+    with open(path, errors="ignore") as f:
+        while True:
+            block = f.read(SEARCH_BLOCK_SIZE)
+            if not block:
+                break
+            # Finish the line the block boundary cut through so it is matched whole
+            block += f.readline()
+            matches.extend(pattern.findall(block))
+    lines = list(matches)
+    lines.reverse()
+    return lines
+
+
+def render_dashboard_html(lines, query=None):
+    # The page is at most a 64 KiB tail, so one render beats streaming Jinja's tiny fragments
+    return dashboard_template.render(logs=lines, q=query)
@@ -1,15 +1,18 @@
 import logging
 
-import requests
+import orjson
 
 from config.settings import OPA_URL
+from logic.utils import get_http_client, request_cached
 
+_HEADERS = {"Content-Type": "application/json"}
 
-def enforce_policy(user_data):
+
+@request_cached
+async def enforce_policy(user_data):
     try:
-        response = requests.post(OPA_URL, json={"input": user_data})
+        response = await get_http_client().post(OPA_URL, headers=_HEADERS, content=orjson.dumps({"input": user_data}))
         return response.json().get("result", {})
     except Exception as e:
         logging.error(f"OPA policy enforcement failed: {str(e)}")
         return {"allow": False, "reason": "OPA policy check failed"}
-
@@ -0,0 +1,162 @@
+import asyncio
+import contextvars
+import functools
+import hashlib
+import inspect
+import json
+import logging
+
+import httpx
+import orjson
+from fastapi.responses import JSONResponse
+from tenacity import (
+    retry,
+    retry_if_exception_type,
+    retry_if_result,
+    stop_after_attempt,
+    wait_random_exponential,
+)
+
+from config.settings import (
+    ENTRA_CLIENT_ID,
+    HTTP_MAX_CONNECTIONS,
+    HTTP_MAX_KEEPALIVE,
+    HTTP_RETRY_ATTEMPTS,
+    HTTP_TIMEOUT,
+    OPA_URL,
+    STARTUP_WARMUP_TIMEOUT,
+)
+
+# Provider user creation is a non-idempotent POST, so only retry when the request was refused
+# outright (throttled/unavailable) or never reached the server (connect or pool errors)
+RETRYABLE_STATUS_CODES = {429, 503}
+RETRYABLE_ERRORS = (httpx.ConnectError, httpx.ConnectTimeout, httpx.PoolTimeout)
+
+_http_client = None
+
+# Per-request memo table, bound by the app middleware for the lifetime of one request
+_request_cache = contextvars.ContextVar("request_cache", default=None)
+
+
+def get_http_client():
+    # One pooled client per process so keep-alive connections and TLS sessions are reused
+    global _http_client
+    if _http_client is None or _http_client.is_closed:
+        _http_client = httpx.AsyncClient(
+            timeout=HTTP_TIMEOUT,
+            limits=httpx.Limits(
+                max_connections=HTTP_MAX_CONNECTIONS,
+                max_keepalive_connections=HTTP_MAX_KEEPALIVE,
+            ),
+        )
+    return _http_client
+
+
+async def prewarm_http(*urls):
+    # A throwaway HEAD opens pooled connections (DNS, TCP, TLS) before the first real request needs them
+    client = get_http_client()
+    results = await asyncio.gather(*(client.head(url) for url in urls), return_exceptions=True)
+    for url, result in zip(urls, results, strict=True):
+        if isinstance(result, Exception):
+            logging.warning(f"Connection warm-up failed for {url}: {result}")
+
+
+async def warm_up_providers():
+    # Pay client construction and connection setup here rather than on the first provisioning request.
+    # The provider modules import this one, so they are only imported once startup runs.
+    from provision import aws, entra
+
+    steps = [prewarm_http(OPA_URL, entra.GRAPH_USERS_URL), asyncio.to_thread(aws.get_sso_admin_client)]
+    if ENTRA_CLIENT_ID:
+        steps.append(entra.get_graph_token())
+    try:
+        results = await asyncio.wait_for(asyncio.gather(*steps, return_exceptions=True), STARTUP_WARMUP_TIMEOUT)
+    except TimeoutError:
+        logging.warning("Startup warm-up timed out")
+        return
+    for result in results:
+        if isinstance(result, Exception):
+            logging.warning(f"Startup warm-up step failed: {result}")
+
+
+async def close_http_client():
+    global _http_client
+    if _http_client is not None:
+        await _http_client.aclose()
+        _http_client = None
+
+
+class ORJSONResponse(JSONResponse):
+    # FastAPI's bundled ORJSONResponse is deprecated; this keeps orjson as the default encoder
+    def render(self, content):
+        return orjson.dumps(content)
+
+
+def _is_retryable(response):
+    return response.status_code in RETRYABLE_STATUS_CODES
+
+
+# Throttled or unreachable calls back off with jitter; once attempts run out the last response is returned
+@retry(
+    retry=retry_if_result(_is_retryable) | retry_if_exception_type(RETRYABLE_ERRORS),
+    wait=wait_random_exponential(multiplier=0.5, max=10),
+    stop=stop_after_attempt(HTTP_RETRY_ATTEMPTS),
+    retry_error_callback=lambda retry_state: retry_state.outcome.result(),
+)
+async def post_with_retry(semaphore, url, **kwargs):
+    # The slot is held per attempt, so a call sleeping in backoff doesn't block other requests
+    async with semaphore:
+        return await get_http_client().post(url, **kwargs)
+
+
+async def run_async(func, *args):
+    # Await coroutine functions directly; push blocking helpers onto the default thread pool
+    if inspect.iscoroutinefunction(func):
+        return await func(*args)
+    return await asyncio.to_thread(func, *args)
+
+
+async def call_provider(module, name, *args):
+    # Resolved inside the coroutine so a provider missing an operation fails only its own call
+    func = getattr(module, name, None)
+    if func is None:
+        raise NotImplementedError(f"{module.__name__}.{name} is not implemented")
+    return await run_async(func, *args)
+
+
+def unwrap_result(result, name):
+    # Turn an exception captured by asyncio.gather(return_exceptions=True) into an error payload
+    if isinstance(result, Exception):
+        logging.error(f"{name} call failed: {result}")
+        return {"error": str(result)}
+    return result
+
+
+def profile_cache_key(profile):
+    # Case and surrounding whitespace don't change a recommendation, so fold them into one key
+    normalized = {k: str(v).strip().lower() if v is not None else "" for k, v in profile.items()}
+    return hashlib.blake2b(json.dumps(normalized, sort_keys=True).encode(), digest_size=16).hexdigest()
+
+
+def bind_request_cache(cache):
+    return _request_cache.set(cache)
+
+
+def reset_request_cache(token):
+    _request_cache.reset(token)
+
+
+def request_cached(func):
+    # Memoize a coroutine for the current request only; outside a request it is a plain call.
+    # The task is stored rather than its result, so concurrent callers share one in-flight lookup.
+    @functools.wraps(func)
+    async def wrapper(*args):
+        cache = _request_cache.get()
+        if cache is None:
+            return await func(*args)
+        key = (func.__module__, func.__qualname__, orjson.dumps(args, default=str, option=orjson.OPT_SORT_KEYS))
+        task = cache.get(key)
+        if task is None or task.cancelled() or task.cancelling():
+            task = cache[key] = asyncio.ensure_future(func(*args))
+        return await task
+    return wrapper
@@ -1,5 +1,7 @@
-import os
+import asyncio
+import json
 import logging
+import os
 import secrets
 import sys
 from dotenv import load_dotenv
@@ -12,77 +14,122 @@ except ModuleNotFoundError:
     import types
     sys.modules['ssl'] = types.SimpleNamespace()
 
+import orjson
+from cachetools import TTLCache
 from fastapi import FastAPI, Request, Depends, HTTPException, status
-from fastapi.responses import HTMLResponse
+from fastapi.responses import HTMLResponse, Response
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.middleware.gzip import GZipMiddleware
 from fastapi.security import HTTPBasic, HTTPBasicCredentials
-from pydantic import BaseModel
+from pydantic import BaseModel, ConfigDict
+
+from config.settings import (
+    OPENAI_MODEL,
+    RECOMMENDATION_CACHE_SIZE,
+    RECOMMENDATION_CACHE_TTL,
+)
+from logic import opa_enforcer
+from logic.audit_log import (
+    audit_log_etag,
+    configure_audit_logging,
+    read_log_tail,
+    render_dashboard_html,
+    search_log,
+    start_audit_log_writer,
+    stop_audit_log_writer,
+)
+from logic.utils import (
+    ORJSONResponse,
+    bind_request_cache,
+    call_provider,
+    close_http_client,
+    get_http_client,
+    profile_cache_key,
+    request_cached,
+    reset_request_cache,
+    run_async,
+    unwrap_result,
+    warm_up_providers,
+)
+from provision import aws, entra, sailpoint
 
 # Handle openai import errors
 try:
-    import openai
-except ModuleNotFoundError:
-    openai = None
+    from openai import AsyncOpenAI
 
-# Conditional imports to handle environments lacking certain modules
-def safe_import(module_name, alias=None):
-    try:
-        module = __import__(module_name, fromlist=[''])
-        if alias:
-            globals()[alias] = module
-        else:
-            globals()[module_name] = module
-    except ImportError:
-        from unittest import mock
-        globals()[alias or module_name] = mock.Mock()
-
-safe_import("provision.entra", "entra")
-safe_import("provision.aws", "aws")
-safe_import("provision.sailpoint", "sailpoint")
-safe_import("logic.opa_enforcer", "opa_enforcer")
-
-# Patch mocks to return safe values for testing
-def patch_mock_returns():
-    if isinstance(opa_enforcer, object):
-        opa_enforcer.enforce_policy.return_value = {"allow": True}
-    if isinstance(entra, object):
-        entra.create_entra_user.return_value = ("success", "User created")
-        entra.delete_entra_user.return_value = "success"
-        entra.update_entra_user.return_value = "success"
-    if isinstance(aws, object):
-        aws.create_user.return_value = "success"
-        aws.delete_user.return_value = "success"
-        aws.update_user.return_value = "success"
-    if isinstance(sailpoint, object):
-        sailpoint.push_to_sailpoint.return_value = "User pushed"
-        sailpoint.delete_user.return_value = "success"
-        sailpoint.update_user_attributes.return_value = "success"
-
-patch_mock_returns()
+    from logic.ai_recommender import OPENAI_SEM
+except ModuleNotFoundError:
+    AsyncOpenAI = None
+    OPENAI_SEM = None
 
 # Load environment variables from .env file
 load_dotenv()
 
-app = FastAPI()
+app = FastAPI(default_response_class=ORJSONResponse)
 security = HTTPBasic()
 
-# Add CORS support for frontend connection
+FRONTEND_ORIGIN = os.getenv("FRONTEND_ORIGIN", "http://localhost:3000")
+
+# Credentialed CORS is only allowed for the configured frontend, never a wildcard
 app.add_middleware(
     CORSMiddleware,
-    allow_origins=["*"],  # In production, restrict this to your frontend domain
+    allow_origins=[FRONTEND_ORIGIN],
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
 )
+# The dashboard is repetitive <div> markup and compresses well; small JSON bodies are left alone
+app.add_middleware(GZipMiddleware, minimum_size=1024)
 
 DASHBOARD_USER = os.getenv("DASHBOARD_USER", "admin")
 DASHBOARD_PASS = os.getenv("DASHBOARD_PASS", "adminpass")
 OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
+SAILPOINT_WEBHOOK_SECRET = os.getenv("SAILPOINT_WEBHOOK_SECRET")
+PROVISIONING_WORKERS = int(os.getenv("PROVISIONING_WORKERS", "10"))
+# How many finished/pending job records are kept in memory, and for how long (seconds)
+JOB_HISTORY_SIZE = int(os.getenv("JOB_HISTORY_SIZE", "10000"))
+JOB_HISTORY_TTL = int(os.getenv("JOB_HISTORY_TTL", "86400"))
+# The page sits behind basic auth, so only the browser may cache it; quick refreshes skip the server
+DASHBOARD_CACHE_HEADERS = {"Cache-Control": "private, max-age=5"}
 
 os.makedirs("logs", exist_ok=True)
-logging.basicConfig(filename="logs/audit.log", level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+configure_audit_logging()
+
+openai_client = None
+
+@app.on_event("startup")
+async def startup():
+    global openai_client, provisioning_queue
+    start_audit_log_writer()
+    get_http_client()
+    if AsyncOpenAI and OPENAI_API_KEY:
+        openai_client = AsyncOpenAI(api_key=OPENAI_API_KEY)
+    provisioning_queue = asyncio.Queue()
+    _provisioning_workers.extend(asyncio.create_task(provisioning_worker()) for _ in range(PROVISIONING_WORKERS))
+    await warm_up_providers()
+
+@app.on_event("shutdown")
+async def shutdown():
+    for task in [*_bulk_watchers, *_provisioning_workers]:
+        task.cancel()
+    _provisioning_workers.clear()
+    await close_http_client()
+    if openai_client:
+        await openai_client.close()
+    stop_audit_log_writer()
+
+@app.middleware("http")
+async def request_cache_middleware(request: Request, call_next):
+    request.state.cache = {}
+    token = bind_request_cache(request.state.cache)
+    try:
+        return await call_next(request)
+    finally:
+        reset_request_cache(token)
 
 class UserModel(BaseModel):
+    model_config = ConfigDict(populate_by_name=True)
+
     email: str
     firstName: Optional[str] = None
     lastName: Optional[str] = None
@@ -109,91 +156,316 @@ def health_check():
     return {"status": "ok"}
 
 @app.get("/dashboard", response_class=HTMLResponse)
-def dashboard(credentials: HTTPBasicCredentials = Depends(authenticate)):
+def dashboard(request: Request, q: Optional[str] = None, credentials: HTTPBasicCredentials = Depends(authenticate)):
     try:
-        with open("logs/audit.log", "r") as f:
-            logs = f.readlines()
-        logs.reverse()
-        formatted_logs = ''.join(f"<div>{log.strip()}</div>" for log in logs)
-        return f"""
-            <html>
-                <head><title>Audit Log Dashboard</title></head>
-                <body>
-                    <h2>Audit Log</h2>
-                    <form method='get'>
-                        <input type='text' name='q' placeholder='Search logs...' />
-                        <input type='submit' value='Search' />
-                    </form>
-                    <div style='font-family: monospace; white-space: pre-wrap;'>{formatted_logs}</div>
-                </body>
-            </html>
-        """
+        etag = audit_log_etag()
+        if request.headers.get("if-none-match") == etag:
+            return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers={"ETag": etag, **DASHBOARD_CACHE_HEADERS})
+        logs = search_log(q) if q else read_log_tail()
     except FileNotFoundError:
         return "<html><body><h2>No logs available yet.</h2></body></html>"
+    return HTMLResponse(render_dashboard_html(logs, q), headers={"ETag": etag, **DASHBOARD_CACHE_HEADERS})
 
-def get_ai_access_recommendation(user_dict):
-    if not OPENAI_API_KEY:
-        return {"error": "Missing OpenAI API key"}
-    if not openai:
-        return {"error": "openai module not found"}
+# Only role attributes shape the recommendation; identity fields would make every prompt unique
+RECOMMENDATION_FIELDS = ("jobTitle", "department", "location", "region", "costcenter")
+_recommendation_cache = TTLCache(maxsize=RECOMMENDATION_CACHE_SIZE, ttl=RECOMMENDATION_CACHE_TTL)
+
+def recommendation_profile(user_dict):
+    return {field: user_dict.get(field) for field in RECOMMENDATION_FIELDS}
 
-    openai.api_key = OPENAI_API_KEY
+def recommendation_messages(profile):
     prompt = f"""
     Given the following user profile, suggest access entitlements:
-    {user_dict}
+    {profile}
     Return a JSON with recommended entitlements.
     """
+    return [{"role": "user", "content": prompt}]
+
+@request_cached
+async def get_ai_access_recommendation(user_dict):
+    if not OPENAI_API_KEY:
+        return {"error": "Missing OpenAI API key"}
+    if not openai_client:
+        return {"error": "openai module not found"}
+
+    profile = recommendation_profile(user_dict)
+    key = profile_cache_key(profile)
+    cached = _recommendation_cache.get(key)
+    if cached is not None:
+        return cached
+
     try:
-        response = openai.ChatCompletion.create(
-            model="gpt-4",
-            messages=[{"role": "user", "content": prompt}]
-        )
-        result = response['choices'][0]['message']['content']
-        return {"entitlements": result}
+        async with OPENAI_SEM:
+            response = await openai_client.chat.completions.create(
+                model=OPENAI_MODEL,
+                messages=recommendation_messages(profile)
+            )
+        result = response.choices[0].message.content
     except Exception as e:
         logging.error(f"AI error: {e}")
         return {"error": str(e)}
 
+    recommendation = {"entitlements": result}
+    _recommendation_cache[key] = recommendation
+    return recommendation
+
+async def check_policy(user_dict):
+    try:
+        return await run_async(opa_enforcer.enforce_policy, user_dict)
+    except Exception as e:
+        logging.error(f"OPA policy enforcement failed: {e}")
+        return {"allow": False, "reason": "OPA policy check failed"}
+
+# SailPoint accepts long-running jobs with a 202 and reports completion to /webhook/sailpoint.
+# Entries expire on their own, since a webhook may never arrive for some jobs.
+sailpoint_jobs = TTLCache(maxsize=JOB_HISTORY_SIZE, ttl=JOB_HISTORY_TTL)
+
+def track_sailpoint_job(email, sailpoint_result):
+    if not isinstance(sailpoint_result, tuple):
+        return
+    status_code, body = sailpoint_result
+    if status_code == status.HTTP_202_ACCEPTED and isinstance(body, dict) and body.get("id"):
+        sailpoint_jobs[body["id"]] = {"email": email, "status": "pending"}
+        logging.info(f"SailPoint job {body['id']} accepted for {email}")
+
+async def provision_accounts(user_dict):
+    entra_outcome, aws_status, sailpoint_result = await asyncio.gather(
+        call_provider(entra, "create_entra_user", user_dict),
+        call_provider(aws, "create_user", user_dict),
+        call_provider(sailpoint, "push_to_sailpoint", user_dict),
+        return_exceptions=True,
+    )
+    if isinstance(entra_outcome, tuple):
+        entra_status, entra_result = entra_outcome
+    else:
+        entra_status, entra_result = "error", unwrap_result(entra_outcome, "Entra")
+    aws_status = unwrap_result(aws_status, "AWS")
+    sailpoint_result = unwrap_result(sailpoint_result, "SailPoint")
+    track_sailpoint_job(user_dict["email"], sailpoint_result)
+
+    logging.info(f"Provisioning complete: Entra={entra_status}, AWS={aws_status}, SailPoint={sailpoint_result}")
+
+    return {
+        "entra_status": entra_status,
+        "entra_result": entra_result,
+        "aws_status": aws_status,
+        "sailpoint_result": sailpoint_result
+    }
+
 @app.post("/provision/user")
 async def provision_user(user: UserModel):
     logging.info(f"Received provisioning request for: {user.email}")
+    user_dict = user.model_dump()
 
-    ai_access = get_ai_access_recommendation(user.dict())
-    logging.info(f"AI access recommendation: {ai_access}")
-
-    policy_check = opa_enforcer.enforce_policy(user.dict()) if opa_enforcer else {"allow": True}
+    # The AI recommendation and the policy check are independent, so start both up front
+    ai_task = asyncio.create_task(get_ai_access_recommendation(user_dict))
+    policy_check = await check_policy(user_dict)
     if not policy_check.get("allow", False):
+        ai_task.cancel()
         reason = policy_check.get("reason", "Policy Violation")
         logging.warning(f"Access denied due to policy: {reason}")
         return {"status": "denied", "reason": reason}
 
-    entra_status, entra_result = entra.create_entra_user(user.dict()) if entra else ("error", "module missing")
-    aws_status = aws.create_user(user.dict()) if aws else "module missing"
-    sailpoint_result = sailpoint.push_to_sailpoint(user.dict()) if sailpoint else "module missing"
-
-    logging.info(f"Provisioning complete: Entra={entra_status}, AWS={aws_status}, SailPoint={sailpoint_result}")
+    try:
+        ai_access, accounts = await asyncio.gather(ai_task, provision_accounts(user_dict))
+    except Exception:
+        ai_task.cancel()
+        raise
+    logging.info(f"AI access recommendation: {ai_access}")
 
     return {
-        "entra_status": entra_status,
-        "entra_result": entra_result,
-        "aws_status": aws_status,
+        "entra_status": accounts["entra_status"],
+        "entra_result": accounts["entra_result"],
+        "aws_status": accounts["aws_status"],
         "ai_access": ai_access,
         "policy_check": policy_check,
-        "sailpoint_result": sailpoint_result
+        "sailpoint_result": accounts["sailpoint_result"]
     }
 
+# Bulk jobs keyed by OpenAI batch id; custom_id on each batch line is the user's email.
+# Live jobs hold every user dict; once final, only status and results are kept, and only for a while.
+bulk_jobs = {}
+finished_bulk_jobs = TTLCache(maxsize=JOB_HISTORY_SIZE, ttl=JOB_HISTORY_TTL)
+_bulk_watchers = set()
+# Per-user provisioning events from finished batches, drained by background workers
+provisioning_queue = None
+_provisioning_workers = []
+BULK_POLL_INITIAL_DELAY = 5
+BULK_POLL_MAX_DELAY = 300
+BULK_TERMINAL_STATUSES = {"completed", "failed", "expired", "cancelled"}
+
+def finish_bulk_job(batch_id, final_status):
+    job = bulk_jobs.pop(batch_id)
+    finished_bulk_jobs[batch_id] = {"status": final_status, "results": job["results"]}
+
+def build_bulk_batch_file(users):
+    lines = [
+        json.dumps({
+            "custom_id": email,
+            "method": "POST",
+            "url": "/v1/chat/completions",
+            "body": {"model": OPENAI_MODEL, "messages": recommendation_messages(recommendation_profile(user_dict))},
+        })
+        for email, user_dict in users.items()
+    ]
+    return "\n".join(lines).encode()
+
+def parse_bulk_batch_output(text):
+    recommendations = {}
+    for line in text.splitlines():
+        if not line.strip():
+            continue
+        record = json.loads(line)
+        response = record.get("response") or {}
+        if record.get("error") or response.get("status_code") != 200:
+            recommendations[record["custom_id"]] = {"error": str(record.get("error") or response.get("body"))}
+        else:
+            content = response["body"]["choices"][0]["message"]["content"]
+            recommendations[record["custom_id"]] = {"entitlements": content}
+    return recommendations
+
+async def provision_bulk_user(user_dict, ai_access):
+    policy_check = await check_policy(user_dict)
+    if not policy_check.get("allow", False):
+        reason = policy_check.get("reason", "Policy Violation")
+        logging.warning(f"Bulk access denied for {user_dict['email']} due to policy: {reason}")
+        return {"status": "denied", "reason": reason, "ai_access": ai_access}
+    accounts = await provision_accounts(user_dict)
+    return {**accounts, "ai_access": ai_access, "policy_check": policy_check}
+
+async def provisioning_worker():
+    while True:
+        batch_id, email, ai_access = await provisioning_queue.get()
+        job = bulk_jobs[batch_id]
+        try:
+            result = await provision_bulk_user(job["users"][email], ai_access)
+        except Exception as e:
+            result = unwrap_result(e, "Bulk provisioning")
+        job["results"][email] = result
+        if len(job["results"]) == len(job["users"]):
+            finish_bulk_job(batch_id, "done")
+            logging.info(f"Bulk batch {batch_id} provisioned {len(job['users'])} users")
+        provisioning_queue.task_done()
+
+async def watch_bulk_batch(batch_id):
+    # This task outlives the request that started it, so it must not share that request's memo table
+    bind_request_cache(None)
+    job = bulk_jobs[batch_id]
+    delay = BULK_POLL_INITIAL_DELAY
+    while True:
+        await asyncio.sleep(delay)
+        try:
+            batch = await openai_client.batches.retrieve(batch_id)
+        except Exception as e:
+            logging.error(f"Bulk batch {batch_id} status check failed: {e}")
+        else:
+            job["status"] = batch.status
+            if batch.status in BULK_TERMINAL_STATUSES:
+                break
+        delay = min(delay * 2, BULK_POLL_MAX_DELAY)
+
+    if batch.status != "completed":
+        finish_bulk_job(batch_id, batch.status)
+        logging.warning(f"Bulk batch {batch_id} finished with status {batch.status}")
+        return
+    if not batch.output_file_id:
+        finish_bulk_job(batch_id, "failed")
+        logging.error(f"Bulk batch {batch_id} completed without an output file")
+        return
+
+    try:
+        output = await openai_client.files.content(batch.output_file_id)
+        recommendations = parse_bulk_batch_output(output.text)
+    except Exception as e:
+        finish_bulk_job(batch_id, "failed")
+        logging.error(f"Bulk batch {batch_id} output could not be read: {e}")
+        return
+    job["status"] = "provisioning"
+    for email in job["users"]:
+        provisioning_queue.put_nowait((batch_id, email, recommendations.get(email, {"error": "No recommendation returned"})))
+    logging.info(f"Bulk batch {batch_id} queued {len(job['users'])} users for provisioning")
+
+@app.post("/provision/users/bulk", status_code=status.HTTP_202_ACCEPTED)
+async def provision_users_bulk(users: list[UserModel]):
+    if not openai_client:
+        raise HTTPException(status_code=status.HTTP_503_SERVICE_UNAVAILABLE, detail="OpenAI client not configured")
+    if not users:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="No users in bulk request")
+    user_dicts = {user.email: user.model_dump() for user in users}
+    if len(user_dicts) != len(users):
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Duplicate email in bulk request")
+    logging.info(f"Received bulk provisioning request for {len(users)} users")
+
+    batch_file = await openai_client.files.create(
+        file=("bulk_provision.jsonl", build_bulk_batch_file(user_dicts)), purpose="batch"
+    )
+    batch = await openai_client.batches.create(
+        input_file_id=batch_file.id, endpoint="/v1/chat/completions", completion_window="24h"
+    )
+    bulk_jobs[batch.id] = {"status": batch.status, "users": user_dicts, "results": {}}
+    watcher = asyncio.create_task(watch_bulk_batch(batch.id))
+    _bulk_watchers.add(watcher)
+    watcher.add_done_callback(_bulk_watchers.discard)
+    return {"batch_id": batch.id, "status": batch.status, "users": len(user_dicts)}
+
+@app.get("/provision/users/bulk/{batch_id}")
+async def bulk_status(batch_id: str):
+    job = bulk_jobs.get(batch_id) or finished_bulk_jobs.get(batch_id)
+    if job is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Unknown batch")
+    return {"batch_id": batch_id, "status": job["status"], "results": job["results"]}
+
+@app.post("/webhook/sailpoint")
+async def sailpoint_webhook(request: Request):
+    secret = request.headers.get("X-Webhook-Secret", "")
+    if not SAILPOINT_WEBHOOK_SECRET or not secrets.compare_digest(secret, SAILPOINT_WEBHOOK_SECRET):
+        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Unauthorized")
+    try:
+        event = orjson.loads(await request.body())
+    except orjson.JSONDecodeError:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Invalid JSON body") from None
+    if not isinstance(event, dict) or not isinstance(event.get("id"), str):
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Expected a JSON object with a job id")
+    job = sailpoint_jobs.get(event["id"])
+    if job is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Unknown SailPoint job")
+    job["status"] = event.get("status", "unknown")
+    logging.info(f"SailPoint job {event['id']} for {job['email']} reported status {job['status']}")
+    return {"status": "ok"}
+
+@app.get("/provision/sailpoint/jobs/{job_id}")
+async def sailpoint_job_status(job_id: str):
+    job = sailpoint_jobs.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Unknown SailPoint job")
+    return {"job_id": job_id, **job}
+
 @app.post("/deprovision/user")
 async def deprovision_user(user: UserModel):
-    entra_status = entra.delete_entra_user(user.dict()) if entra else "module missing"
-    aws_status = aws.delete_user(user.dict()) if aws else "module missing"
-    sailpoint_status = sailpoint.delete_user(user.dict()) if sailpoint else "module missing"
+    user_dict = user.model_dump()
+    results = await asyncio.gather(
+        call_provider(entra, "delete_entra_user", user_dict),
+        call_provider(aws, "delete_user", user_dict),
+        call_provider(sailpoint, "delete_user", user_dict),
+        return_exceptions=True,
+    )
+    entra_status, aws_status, sailpoint_status = (
+        unwrap_result(result, name) for result, name in zip(results, ("Entra", "AWS", "SailPoint"), strict=True)
+    )
     logging.info(f"Deprovisioned user: {user.email}, Entra={entra_status}, AWS={aws_status}, SailPoint={sailpoint_status}")
     return {"entra_status": entra_status, "aws_status": aws_status, "sailpoint_status": sailpoint_status}
 
 @app.post("/update/user")
 async def update_user(user: UserModel):
-    entra_status = entra.update_entra_user(user.dict()) if entra else "module missing"
-    aws_status = aws.update_user(user.dict()) if aws else "module missing"
-    sailpoint_status = sailpoint.update_user_attributes(user.dict()) if sailpoint else "module missing"
+    user_dict = user.model_dump()
+    results = await asyncio.gather(
+        call_provider(entra, "update_entra_user", user_dict),
+        call_provider(aws, "update_user", user_dict),
+        call_provider(sailpoint, "update_user_attributes", user_dict),
+        return_exceptions=True,
+    )
+    entra_status, aws_status, sailpoint_status = (
+        unwrap_result(result, name) for result, name in zip(results, ("Entra", "AWS", "SailPoint"), strict=True)
+    )
     logging.info(f"Updated user: {user.email}, Entra={entra_status}, AWS={aws_status}, SailPoint={sailpoint_status}")
     return {"entra_status": entra_status, "aws_status": aws_status, "sailpoint_status": sailpoint_status}
@@ -1,17 +1,36 @@
+import threading
+
 import boto3
+from botocore.config import Config
+
+from config.settings import AWS_MAX_CONCURRENCY, AWS_REGION
+
+_SSO_ADMIN = None
+# boto3 calls run on worker threads, so the cap is a thread semaphore rather than an asyncio one
+AWS_SEM = threading.BoundedSemaphore(AWS_MAX_CONCURRENCY)
 
-from config.settings import AWS_REGION
+
+def get_sso_admin_client():
+    # Build the client once so every call reuses botocore's connection pool
+    global _SSO_ADMIN
+    if _SSO_ADMIN is None:
+        _SSO_ADMIN = boto3.session.Session().client(
+            'sso-admin',
+            region_name=AWS_REGION,
+            config=Config(max_pool_connections=50, retries={'max_attempts': 3, 'mode': 'adaptive'})
+        )
+    return _SSO_ADMIN
 
 
 def assign_aws_permission_set(identity_center_user_id, permission_set_arn, instance_arn):
-    client = boto3.client('sso-admin', region_name=AWS_REGION)
-    response = client.create_account_assignment(
-        InstanceArn=instance_arn,
-        TargetId=identity_center_user_id,
-        TargetType='USER',
-        PermissionSetArn=permission_set_arn,
-        PrincipalType='USER',
-        PrincipalId=identity_center_user_id
-    )
+    client = get_sso_admin_client()
+    with AWS_SEM:
+        response = client.create_account_assignment(
+            InstanceArn=instance_arn,
+            TargetId=identity_center_user_id,
+            TargetType='USER',
+            PermissionSetArn=permission_set_arn,
+            PrincipalType='USER',
+            PrincipalId=identity_center_user_id
+        )
     return response
-
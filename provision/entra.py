@@ -1,24 +1,56 @@
+import asyncio
+import time
 
-import requests
+import orjson
 
-from config.settings import ENTRA_CLIENT_ID, ENTRA_CLIENT_SECRET, ENTRA_TENANT_ID
+from config.settings import (
+    ENTRA_CLIENT_ID,
+    ENTRA_CLIENT_SECRET,
+    ENTRA_TENANT_ID,
+    GRAPH_MAX_CONCURRENCY,
+)
+from logic.utils import post_with_retry
 
+GRAPH_USERS_URL = "https://graph.microsoft.com/v1.0/users"
+_TOKEN_URL = f"https://login.microsoftonline.com/{ENTRA_TENANT_ID}/oauth2/v2.0/token"
+_TOKEN_REQUEST = {
+    'client_id': ENTRA_CLIENT_ID,
+    'scope': 'https://graph.microsoft.com/.default',
+    'client_secret': ENTRA_CLIENT_SECRET,
+    'grant_type': 'client_credentials'
+}
 
-def get_graph_token():
-    url = f"https://login.microsoftonline.com/{ENTRA_TENANT_ID}/oauth2/v2.0/token"
-    data = {
-        'client_id': ENTRA_CLIENT_ID,
-        'scope': 'https://graph.microsoft.com/.default',
-        'client_secret': ENTRA_CLIENT_SECRET,
-        'grant_type': 'client_credentials'
-    }
-    r = requests.post(url, data=data)
-    return r.json()['access_token']
+# Graph tokens live for about an hour; refresh a minute before they expire.
+# The request headers only change with the token, so they are cached alongside it.
+_token_cache = {'token': None, 'exp': 0, 'headers': None}
+_token_lock = asyncio.Lock()
+GRAPH_SEM = asyncio.Semaphore(GRAPH_MAX_CONCURRENCY)
+TOKEN_EXPIRY_MARGIN = 60
+
+
+async def get_graph_token():
+    if time.monotonic() < _token_cache['exp'] - TOKEN_EXPIRY_MARGIN:
+        return _token_cache['token']
+    async with _token_lock:
+        # Another request may have refreshed the token while we waited for the lock
+        if time.monotonic() < _token_cache['exp'] - TOKEN_EXPIRY_MARGIN:
+            return _token_cache['token']
+        _token_cache['token'], _token_cache['exp'] = await _fetch_graph_token()
+        _token_cache['headers'] = {"Authorization": f"Bearer {_token_cache['token']}", "Content-Type": "application/json"}
+        return _token_cache['token']
 
-def create_entra_user(user):
-    token = get_graph_token()
-    url = "https://graph.microsoft.com/v1.0/users"
-    headers = {"Authorization": f"Bearer {token}", "Content-Type": "application/json"}
+async def get_graph_headers():
+    await get_graph_token()
+    return _token_cache['headers']
+
+async def _fetch_graph_token():
+    requested_at = time.monotonic()
+    r = await post_with_retry(GRAPH_SEM, _TOKEN_URL, data=_TOKEN_REQUEST)
+    body = r.json()
+    return body['access_token'], requested_at + body.get('expires_in', 3600)
+
+async def create_entra_user(user):
+    headers = await get_graph_headers()
     payload = {
         "accountEnabled": True,
         "displayName": user["name"],
@@ -29,6 +61,5 @@ def create_entra_user(user):
             "password": user["temp_password"]
         }
     }
-    r = requests.post(url, headers=headers, json=payload)
+    r = await post_with_retry(GRAPH_SEM, GRAPH_USERS_URL, headers=headers, content=orjson.dumps(payload))
     return r.status_code, r.json()
-
@@ -1,14 +1,20 @@
-import requests
+import asyncio
 import logging
-from config.settings import SAILPOINT_API_KEY
 
-def push_to_sailpoint(user):
+import orjson
+
+from config.settings import SAILPOINT_API_KEY, SAILPOINT_MAX_CONCURRENCY
+from logic.utils import post_with_retry
+
+SAILPOINT_USERS_URL = "https://your-sailpoint-instance.com/api/v3/users"
+_HEADERS = {
+    "Authorization": f"Bearer {SAILPOINT_API_KEY}",
+    "Content-Type": "application/json"
+}
+SAILPOINT_SEM = asyncio.Semaphore(SAILPOINT_MAX_CONCURRENCY)
+
+async def push_to_sailpoint(user):
     try:
-        url = "https://your-sailpoint-instance.com/api/v3/users"
-        headers = {
-            "Authorization": f"Bearer {SAILPOINT_API_KEY}",
-            "Content-Type": "application/json"
-        }
         payload = {
             "name": user["name"],
             "email": user["email"],
@@ -21,8 +27,8 @@ def push_to_sailpoint(user):
                 "costcenter": user.get("costcenter")
             }
         }
-        response = requests.post(url, headers=headers, json=payload)
+        response = await post_with_retry(SAILPOINT_SEM, SAILPOINT_USERS_URL, headers=_HEADERS, content=orjson.dumps(payload))
         return response.status_code, response.json()
     except Exception as e:
         logging.error(f"SailPoint API error: {str(e)}")
-        return 500, {"error": str(e)}
\ No newline at end of file
+        return 500, {"error": str(e)}
@@ -1,2 +1,4 @@
 #!/bin/bash
-uvicorn main:app --host=0.0.0.0 --port=8000
+# --preload imports the app once in the master so workers share it copy-on-write; each worker
+# still runs the startup hook to open its own connections. uvloop/httptools are picked up automatically.
+gunicorn main:app -k uvicorn_worker.UvicornWorker --preload -w "${WEB_CONCURRENCY:-1}" --bind=0.0.0.0:8000